@@ -1,16 +1,80 @@
 from __future__ import annotations
 
-import io
+import hashlib
 import time
+from typing import BinaryIO
 
-import altair as alt
 import numpy as np
 import pandas as pd
 import streamlit as st
+try:
+    import pyarrow.csv as pacsv
+except Exception:  # pyarrow 不可用时退回 pandas 解析
+    pacsv = None
 
 
 st.set_page_config(page_title="Demo Streamlit App", page_icon="🧪", layout="wide")
 
+# 直接使用 Vega-Lite spec，跳过 Altair 每次 rerun 的 schema 校验 / to_dict 开销
+_LINE_SPEC = {
+    "mark": "line",
+    "encoding": {
+        "x": {"field": "x", "type": "quantitative"},
+        "y": {"field": "y", "type": "quantitative"},
+        "tooltip": [
+            {"field": "x", "type": "quantitative"},
+            {"field": "y", "type": "quantitative"},
+        ],
+    },
+    "height": 420,
+    "params": [{"name": "grid", "select": "interval", "bind": "scales"}],
+}
+
+
+@st.cache_data(show_spinner=False)
+def _make_df(n: int, seed: int, noise: float) -> pd.DataFrame:
+    # 参数不变时（如点击计数按钮）直接命中缓存，不再重复生成数据
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 10, n)
+    y = np.sin(x)
+    y += rng.standard_normal(n) * noise
+    return pd.DataFrame({"x": x, "y": y})
+
+
+@st.cache_data(show_spinner=False)
+def _to_csv_bytes(n: int, seed: int, noise: float) -> bytes:
+    # 用标量参数做缓存键（对 DataFrame 求哈希很慢）；未点击下载时也不会每次 rerun 重新序列化
+    return _make_df(n, seed, noise).to_csv(index=False).encode("utf-8")
+
+
+def _parse_csv(src: BinaryIO) -> pd.DataFrame:
+    # 不单独缓存整表（长期运行时每个上传文件都会常驻内存），由 _upload_preview 按摘要缓存结果；
+    # 直接从上传文件对象读取，不再额外复制一份 bytes
+    if pacsv is not None:
+        try:
+            src.seek(0)
+            tbl = pacsv.read_csv(src)
+            return tbl.to_pandas(split_blocks=True, self_destruct=True)
+        except Exception:
+            pass
+    src.seek(0)
+    return pd.read_csv(src)
+
+
+# 预览只需要前几行：单独缓存切片（转为 Arrow 类型，Streamlit 序列化更省），
+# rerun 时无需再取出整表并重新 head()
+@st.cache_data(show_spinner=False)
+def _preview(n: int, seed: int, noise: float) -> pd.DataFrame:
+    return _make_df(n, seed, noise).head(100).convert_dtypes(dtype_backend="pyarrow")
+
+
+# 以内容摘要作为缓存键（下划线参数不参与哈希），上传后的 rerun 不再重复解析；只保留形状与前 200 行
+@st.cache_data(show_spinner=False, max_entries=32)
+def _upload_preview(digest: str, _src: BinaryIO) -> tuple[tuple[int, int], pd.DataFrame]:
+    df_up = _parse_csv(_src)
+    return df_up.shape, df_up.head(200).convert_dtypes(dtype_backend="pyarrow")
+
+
 st.title("Demo Streamlit App")
 st.caption("用于验证托管平台：依赖安装、端口启动、日志、编辑/重启等功能。")
 
@@ -39,34 +103,25 @@ if simulate:
     with st.spinner("模拟耗时任务中..."):
         time.sleep(1.2)
 
-np.random.seed(int(seed))
-x = np.linspace(0, 10, int(n))
-y = np.sin(x) + np.random.normal(scale=float(noise), size=int(n))
-df = pd.DataFrame({"x": x, "y": y})
+n, seed, noise = int(n), int(seed), float(noise)
+df = _make_df(n, seed, noise)
 
 left, right = st.columns([1, 1], gap="large")
 
 with left:
     st.subheader("数据预览")
-    st.dataframe(df.head(100), use_container_width=True, height=420)
+    st.dataframe(_preview(n, seed, noise), use_container_width=True, height=420)
     st.download_button(
         "下载 CSV",
-        data=df.to_csv(index=False).encode("utf-8"),
+        data=_to_csv_bytes(n, seed, noise),
         file_name="demo.csv",
         mime="text/csv",
         use_container_width=True,
     )
 
 with right:
-    st.subheader("图表（Altair）")
-    chart = (
-        alt.Chart(df)
-        .mark_line()
-        .encode(x="x:Q", y="y:Q", tooltip=["x:Q", "y:Q"])
-        .properties(height=420)
-        .interactive()
-    )
-    st.altair_chart(chart, use_container_width=True)
+    st.subheader("图表（Vega-Lite）")
+    st.vega_lite_chart(df, _LINE_SPEC, use_container_width=True)
 
 
 st.divider()
@@ -74,10 +129,12 @@ st.subheader("上传并解析 CSV（演示文件上传）")
 up = st.file_uploader("上传 CSV（任意列都可）", type=["csv"])
 if up is not None:
     try:
-        content = up.getvalue()
-        df_up = pd.read_csv(io.BytesIO(content))
-        st.success(f"读取成功：{df_up.shape[0]} 行 × {df_up.shape[1]} 列")
-        st.dataframe(df_up.head(200), use_container_width=True, height=360)
+        # getbuffer() 返回零拷贝视图，仅用于计算摘要
+        with up.getbuffer() as buf:
+            digest = hashlib.blake2b(buf, digest_size=16).hexdigest()
+        (rows, cols), head = _upload_preview(digest, up)
+        st.success(f"读取成功：{rows} 行 × {cols} 列")
+        st.dataframe(head, use_container_width=True, height=360)
     except Exception as e:
         st.error(f"解析失败：{e}")
 
@@ -1,18 +1,20 @@
 from __future__ import annotations
 
+import concurrent.futures
+import functools
 import os
+from collections import deque
 from datetime import datetime
-import html as _html
 from typing import Any, Optional
-from urllib.parse import urlparse
 
+import pandas as pd
 import requests
 import streamlit as st
 import streamlit.components.v1 as components
 try:
-    from streamlit_autorefresh import st_autorefresh
-except Exception:  # 依赖未安装时降级为手动刷新
-    st_autorefresh = None
+    from requests_toolbelt.multipart.encoder import MultipartEncoder
+except Exception:  # 依赖未安装时降级为 requests 自带的 multipart 编码
+    MultipartEncoder = None
 
 
 def _default_api_base() -> str:
@@ -38,24 +40,193 @@ def _guess_public_host_from_api(api_base: str) -> str:
     explicit = os.getenv("STREAMLIT_HOST_PUBLIC_HOST")
     if explicit:
         return explicit
-    p = urlparse(api_base)
-    return p.hostname or "localhost"
+    # 直接切片取 host，避免 urlparse 的完整解析；兼容 user@host 与 [IPv6] 写法
+    netloc = api_base.split("://", 1)[-1].split("/", 1)[0].rsplit("@", 1)[-1]
+    if netloc.startswith("["):
+        host = netloc[1:].split("]", 1)[0]
+    else:
+        host = netloc.split(":", 1)[0]
+    return host.lower() or "localhost"
+
+
+@st.cache_resource
+def _session() -> requests.Session:
+    # 进程内共享一个带连接池的 Session，轮询时复用 keep-alive 连接
+    s = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=8, pool_maxsize=16)
+    s.mount("http://", adapter)
+    s.mount("https://", adapter)
+    return s
+
+
+@st.cache_resource
+def _pool() -> concurrent.futures.ThreadPoolExecutor:
+    # 用于并发发出互不依赖的 API 请求（如详情 + 日志）
+    return concurrent.futures.ThreadPoolExecutor(max_workers=4, thread_name_prefix="admin-api")
 
 
 def _http(method: str, url: str, **kwargs) -> requests.Response:
     timeout = kwargs.pop("timeout", 30)
-    return requests.request(method, url, timeout=timeout, **kwargs)
+    return _session().request(method, url, timeout=timeout, **kwargs)
 
 
-def _fmt_ts(ts: Any) -> str:
+def _http_multipart(method: str, url: str, data: dict[str, str], files: dict[str, tuple], **kwargs) -> requests.Response:
+    # 上传文件直接以文件对象流式编码，不再整体拼出 multipart 请求体
+    if MultipartEncoder is None:
+        return _http(method, url, data=data, files=files or None, **kwargs)
+    m = MultipartEncoder(fields={**data, **files})
+    return _http(method, url, data=m, headers={"Content-Type": m.content_type}, **kwargs)
+
+
+# 与 html.escape(quote=True) 输出一致，但只需一次 C 层遍历
+_LOG_ESCAPE_TABLE = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;", "'": "&#x27;"})
+
+_BADGES = {
+    "running": "🟢 running",
+    "starting": "🟡 starting",
+    "stopped": "⚪ stopped",
+    "failed": "🔴 failed",
+    "created": "⚫ created",
+}
+
+
+def _status_badge(status: str | None) -> str:
+    return _BADGES.get((status or "").lower(), status or "")
+
+
+@functools.lru_cache(maxsize=8192)
+def _fmt_ts_cached(ts: str) -> str:
+    # 自动刷新时同一批时间戳会被反复格式化，按字符串缓存结果
     if not ts:
         return ""
+    # 快速路径：API 的标准格式 YYYY-MM-DDTHH:MM:SS[.ffffff][Z|±HH:MM] 直接切片即可，
+    # 与 fromisoformat + strftime 的结果一致（两者都不做时区换算）
+    if len(ts) >= 19 and ts[4] == "-" and ts[10] == "T":
+        return f"{ts[:10]} {ts[11:19]}"
     try:
         # API 返回是 ISO8601
-        dt = datetime.fromisoformat(str(ts).replace("Z", "+00:00"))
+        dt = datetime.fromisoformat(ts[:-1] + "+00:00" if ts[-1] == "Z" else ts)
         return dt.strftime("%Y-%m-%d %H:%M:%S")
     except Exception:
-        return str(ts)
+        return ts
+
+
+def _fmt_ts(ts: Any) -> str:
+    return _fmt_ts_cached(str(ts)) if ts else ""
+
+
+# 接口结果按短 TTL 缓存：自动刷新触发的连续 rerun 共享同一次 GET + JSON 解析
+@st.cache_data(ttl=2.0, show_spinner=False)
+def fetch_apps(api_base: str) -> list[dict[str, Any]]:
+    r = _http("GET", f"{api_base}/apps")
+    r.raise_for_status()
+    return r.json()
+
+
+@st.cache_data(ttl=1.0, show_spinner=False)
+def fetch_app(api_base: str, app_id: str) -> dict[str, Any]:
+    r = _http("GET", f"{api_base}/apps/{app_id}")
+    r.raise_for_status()
+    return r.json()
+
+
+@st.cache_data(ttl=1.0, show_spinner=False)
+def fetch_logs(api_base: str, app_id: str, tail: int) -> dict[str, Any]:
+    r = _http("GET", f"{api_base}/apps/{app_id}/logs", params={"tail": tail}, timeout=30)
+    r.raise_for_status()
+    return r.json()
+
+
+def fetch_logs_since(api_base: str, app_id: str, since: int) -> dict[str, Any]:
+    # 增量读取：偏移随每次刷新变化，不做缓存
+    r = _http("GET", f"{api_base}/apps/{app_id}/logs", params={"since": since}, timeout=30)
+    r.raise_for_status()
+    return r.json()
+
+
+def _clear_api_cache() -> None:
+    # 创建/启停/修改/删除后立即失效，避免看到旧状态
+    fetch_apps.clear()
+    fetch_app.clear()
+    fetch_logs.clear()
+
+
+def _submit_log_fetch(api_base: str, app_id: str, tail: int) -> tuple[bool, concurrent.futures.Future]:
+    # 增量日志：首次（或尾部行数变化时）拉取最后 tail 行，之后只按偏移拉取新增行
+    buf: deque[str] | None = st.session_state.get(f"log_buf_{app_id}")
+    off: int | None = st.session_state.get(f"log_off_{app_id}")
+    if buf is None or buf.maxlen != tail or off is None:
+        return True, _pool().submit(fetch_logs, api_base, app_id, tail)
+    return False, _pool().submit(fetch_logs_since, api_base, app_id, off)
+
+
+# 固定高度，可滚动；每次刷新后自动滚动到最底部。
+# 静态 CSS/JS 只在模块加载时构造一次，每次刷新只填充 dom_id / 高度 / 日志内容
+_LOG_TMPL = """
+<div id="{dom_id}" style="
+    height: {h}px;
+    overflow-y: auto;
+    border: 1px solid rgba(49, 51, 63, 0.2);
+    border-radius: 6px;
+    padding: 12px;
+    background: rgba(240, 242, 246, 0.6);
+    font-family: ui-monospace, SFMono-Regular, Menlo, Monaco, Consolas, 'Liberation Mono', 'Courier New', monospace;
+    font-size: 12px;
+    white-space: pre;
+">{safe}</div>
+<script>
+  (function() {{
+    const el = document.getElementById("{dom_id}");
+    if (el) {{
+      el.scrollTop = el.scrollHeight;
+    }}
+  }})();
+</script>
+"""
+
+
+def _render_logs_autoscroll(app_id: str, safe: str, height_px: int = 420) -> None:
+    # 用 app_id 做容器 id，避免页面上多个组件冲突
+    components.html(
+        _LOG_TMPL.format_map({"dom_id": f"logbox-{app_id}", "h": height_px, "safe": safe}),
+        height=height_px + 30,
+    )
+
+
+def _log_panel(api_base: str, app_id: str, tail: int) -> None:
+    """
+    以 st.fragment 方式运行：自动刷新只重跑日志这一块，不再重跑整个页面。
+    整页 rerun 时日志请求已和详情请求并发发出，这里直接取走预取结果；fragment 单独重跑时自行拉取。
+    """
+    # 预取结果只存一份（固定 key），取走即删；属于其他应用（切换了选择）的预取直接丢弃
+    prefetch = st.session_state.pop("log_prefetch", None)
+    if prefetch is not None and prefetch[0] == app_id:
+        full_reload, fut = prefetch[1]
+    else:
+        full_reload, fut = _submit_log_fetch(api_base, app_id, tail)
+    # 仅对新增部分做 HTML 转义，已转义的行缓存在 session_state 中
+    buf_key = f"log_buf_{app_id}"
+    # 上次显示的最后一行是否未写完（尾部模式会返回半行）；该行补全后会在下一次增量读取中整行返回
+    partial_key = f"log_partial_{app_id}"
+    try:
+        data = fut.result()
+        # 服务端发现日志被重建时会从头返回（reset），此时也要清空已有内容，避免重复
+        reset = full_reload or bool(data.get("reset"))
+        buf: deque[str] = deque(maxlen=tail) if reset else st.session_state[buf_key]
+        if reset:
+            st.session_state[partial_key] = False
+        chunk = data.get("logs", "")
+        if chunk:
+            if st.session_state.get(partial_key) and buf:
+                buf.pop()
+            buf.extend(chunk.translate(_LOG_ESCAPE_TABLE).splitlines())
+            st.session_state[partial_key] = not chunk.endswith("\n")
+        st.session_state[buf_key] = buf
+        st.session_state[f"log_off_{app_id}"] = int(data.get("next_offset", 0))
+        safe = "\n".join(buf) or "(暂无日志)"
+    except Exception as e:
+        safe = f"获取日志失败：{e}".translate(_LOG_ESCAPE_TABLE)
+    _render_logs_autoscroll(app_id, safe)
 
 
 st.set_page_config(page_title="Streamlit 托管管理台", layout="wide")
@@ -71,17 +242,7 @@ with st.sidebar:
     ).rstrip("/")
     st.divider()
     if st.button("刷新列表", use_container_width=True):
-        st.session_state.pop("apps_cache", None)
-
-
-def fetch_apps() -> list[dict[str, Any]]:
-    if "apps_cache" in st.session_state:
-        return st.session_state["apps_cache"]
-    r = _http("GET", f"{api_base}/apps")
-    r.raise_for_status()
-    apps = r.json()
-    st.session_state["apps_cache"] = apps
-    return apps
+        _clear_api_cache()
 
 
 st.subheader("创建应用（提交应用名 + 上传文件）")
@@ -106,12 +267,12 @@ if submitted:
         st.error("请同时上传 requirements.txt 与 app.py")
         st.stop()
     files = {
-        "requirements": ("requirements.txt", req.getvalue(), "text/plain"),
-        "app": ("app.py", app_py.getvalue(), "text/x-python"),
+        "requirements": ("requirements.txt", req, "text/plain"),
+        "app": ("app.py", app_py, "text/x-python"),
     }
     data = {"name": name.strip()}
     try:
-        r = _http("POST", f"{api_base}/apps", data=data, files=files, timeout=120)
+        r = _http_multipart("POST", f"{api_base}/apps", data=data, files=files, timeout=120)
         r.raise_for_status()
         resp = r.json()
         st.success(f"已创建：{resp.get('name') or ''} ({resp.get('app_id')})")
@@ -119,71 +280,56 @@ if submitted:
         url = f"{public_base}/apps/{app_id}/" if app_id else None
         st.markdown(f"**访问地址**：`{url}`" if url else "**访问地址**：创建成功但 app_id 缺失")
         st.session_state["last_created_app_id"] = resp.get("app_id")
-        st.session_state.pop("apps_cache", None)
+        _clear_api_cache()
     except Exception as e:
         st.error(f"创建失败：{e}")
 
 st.divider()
 st.subheader("应用列表（含状态）")
 try:
-    apps = fetch_apps()
+    apps = fetch_apps(api_base)
 except Exception as e:
     st.error(f"无法获取应用列表：{e}")
     st.stop()
 
-def _status_badge(status: str | None) -> str:
-    s = (status or "").lower()
-    if s == "running":
-        return "🟢 running"
-    if s == "starting":
-        return "🟡 starting"
-    if s == "stopped":
-        return "⚪ stopped"
-    if s == "failed":
-        return "🔴 failed"
-    if s == "created":
-        return "⚫ created"
-    return status or ""
-
 if not apps:
     st.info("暂无应用。")
     st.stop()
 
 options = {a["app_id"]: a for a in apps if a.get("app_id")}
 
-# 列表：点击“查看”后才展示详情/日志
-st.caption("提示：点击某个应用的【查看】后，下方才会出现详情与日志。")
-header = st.columns([2, 2, 2, 3, 1, 1])
-header[0].markdown("**应用名**")
-header[1].markdown("**状态**")
-header[2].markdown("**更新时间**")
-header[3].markdown("**app_id**")
-header[4].markdown("**查看**")
-header[5].markdown("**打开**")
-
-for a in apps:
-    app_id = a.get("app_id")
-    if not app_id:
-        continue
-    name = a.get("name") or app_id
-    status = a.get("status")
-    url = f"{public_base}/apps/{app_id}/"
-
-    cols = st.columns([2, 2, 2, 3, 1, 1])
-    cols[0].write(name)
-    cols[1].write(_status_badge(status))
-    cols[2].write(_fmt_ts(a.get("updated_at")))
-    cols[3].code(app_id)
-
-    if cols[4].button("查看", key=f"view_{app_id}", use_container_width=True):
-        st.session_state["selected_app_id"] = app_id
-        st.session_state["show_details"] = True
-        st.rerun()
-
-    if str(status).lower() in ("running", "starting"):
-        cols[5].link_button("打开", url, use_container_width=True)
-    else:
-        cols[5].button("打开", disabled=True, key=f"open_disabled_{app_id}", use_container_width=True)
+# 列表：整表一次渲染；选中某一行后，下方才会出现详情与日志
+st.caption("提示：点击表格中某个应用所在行，下方才会出现详情与日志。")
+# 整列向量化构建表格，避免逐行调用格式化函数
+# 全部使用 Arrow 字符串类型：st.dataframe 序列化时可直接走 Arrow，免去逐列类型推断
+df = pd.DataFrame(apps, columns=["app_id", "name", "status", "updated_at"]).astype("string[pyarrow]")
+df = df[df["app_id"].fillna("") != ""].reset_index(drop=True)
+status_raw = df["status"].fillna("")
+status_lower = status_raw.str.lower()
+table = pd.DataFrame(
+    {
+        "应用名": df["name"].where(df["name"].fillna("") != "", df["app_id"]),
+        "状态": status_lower.map(_BADGES).fillna(status_raw),
+        "更新时间": pd.to_datetime(df["updated_at"], errors="coerce", utc=True, format="ISO8601")
+        .dt.strftime("%Y-%m-%d %H:%M:%S")
+        .fillna(""),
+        "app_id": df["app_id"],
+        "打开": (f"{public_base}/apps/" + df["app_id"] + "/").where(status_lower.isin(["running", "starting"])),
+    }
+).astype("string[pyarrow]")
+event = st.dataframe(
+    table,
+    use_container_width=True,
+    hide_index=True,
+    column_config={"打开": st.column_config.LinkColumn("打开", display_text="打开")},
+    on_select="rerun",
+    selection_mode="single-row",
+    key="apps_table",
+)
+# 表格数据变化时选择会被重置，因此只在有选中行时更新，保留上一次查看的应用
+if event.selection.rows:
+    st.session_state["selected_app_id"] = table["app_id"].iat[event.selection.rows[0]]
+    st.session_state["show_details"] = True
 
 selected_app_id = st.session_state.get("selected_app_id")
 
@@ -198,7 +344,7 @@ with left:
     st.write(
         {
             "name": a.get("name"),
-            "status": a.get("status"),
+            "status": _status_badge(a.get("status")),
             "created_at": _fmt_ts(a.get("created_at")),
             "updated_at": _fmt_ts(a.get("updated_at")),
         }
@@ -211,7 +357,7 @@ with left:
                 r = _http("POST", f"{api_base}/apps/{selected_app_id}/stop")
                 r.raise_for_status()
                 st.success(f"已停止：{a.get('name') or selected_app_id}")
-                st.session_state.pop("apps_cache", None)
+                _clear_api_cache()
             except Exception as e:
                 st.error(f"停止失败：{e}")
     with col_b:
@@ -220,7 +366,7 @@ with left:
                 r = _http("DELETE", f"{api_base}/apps/{selected_app_id}")
                 r.raise_for_status()
                 st.success(f"已删除：{a.get('name') or selected_app_id}")
-                st.session_state.pop("apps_cache", None)
+                _clear_api_cache()
                 st.session_state.pop("selected_app_id", None)
                 st.rerun()
             except Exception as e:
@@ -232,7 +378,7 @@ with left:
             r = _http("POST", f"{api_base}/apps/{selected_app_id}/start")
             r.raise_for_status()
             st.success(f"已启动：{a.get('name') or selected_app_id}")
-            st.session_state.pop("apps_cache", None)
+            _clear_api_cache()
         except Exception as e:
             st.error(f"启动失败：{e}")
 
@@ -256,11 +402,11 @@ with left:
             data = {"name": new_name.strip()} if new_name.strip() else {}
             files = {}
             if new_req is not None:
-                files["requirements"] = ("requirements.txt", new_req.getvalue(), "text/plain")
+                files["requirements"] = ("requirements.txt", new_req, "text/plain")
             if new_app is not None:
-                files["app"] = ("app.py", new_app.getvalue(), "text/x-python")
+                files["app"] = ("app.py", new_app, "text/x-python")
             try:
-                r = _http("PATCH", f"{api_base}/apps/{selected_app_id}", data=data, files=files or None, timeout=180)
+                r = _http_multipart("PATCH", f"{api_base}/apps/{selected_app_id}", data=data, files=files, timeout=180)
                 r.raise_for_status()
                 meta = r.json()
                 st.success("已提交修改并重启（后台安装依赖中）")
@@ -268,16 +414,21 @@ with left:
                 if app_id:
                     url = f"{public_base}/apps/{app_id}/"
                     st.markdown(f"**新访问地址**：`{url}`")
-                st.session_state.pop("apps_cache", None)
+                _clear_api_cache()
             except Exception as e:
                 st.error(f"修改失败：{e}")
 
 with right:
     st.subheader("详情 / 日志")
+    # 详情与日志两个请求并发发出，重叠网络往返；
+    # 尾部行数控件渲染在下方，这里先从 session_state 读取它的当前值
+    tail = int(st.session_state.get("log_tail", 300))
+    fut_meta = _pool().submit(fetch_app, api_base, selected_app_id)
+    # 固定 key，每次整页 rerun 覆盖上一次的预取，不会为每个选过的应用各留一份
+    st.session_state["log_prefetch"] = (selected_app_id, _submit_log_fetch(api_base, selected_app_id, tail))
+
     try:
-        r = _http("GET", f"{api_base}/apps/{selected_app_id}")
-        r.raise_for_status()
-        meta = r.json()
+        meta = fut_meta.result()
     except Exception as e:
         st.error(f"无法获取详情：{e}")
         st.stop()
@@ -296,54 +447,10 @@ with right:
     st.caption("日志")
     c1, c2, c3 = st.columns([1, 1, 2])
     with c1:
-        tail = st.number_input("尾部行数", min_value=50, max_value=5000, value=300, step=50)
+        st.number_input("尾部行数", min_value=50, max_value=5000, value=300, step=50, key="log_tail")
     with c2:
         auto = st.checkbox("自动刷新", value=True)
     with c3:
         interval = st.number_input("刷新间隔(秒)", min_value=1, max_value=60, value=2, step=1)
 
-    if auto and st_autorefresh is not None:
-        st_autorefresh(interval=int(interval) * 1000, key=f"logs_autorefresh_{selected_app_id}")
-    elif auto and st_autorefresh is None:
-        st.info("未安装自动刷新组件（streamlit-autorefresh），请先安装依赖或使用手动刷新。")
-
-    try:
-        r = _http("GET", f"{api_base}/apps/{selected_app_id}/logs", params={"tail": int(tail)}, timeout=30)
-        r.raise_for_status()
-        logs = r.json().get("logs", "")
-    except Exception as e:
-        logs = f"获取日志失败：{e}"
-
-    # 固定高度，可滚动；每次刷新后自动滚动到最底部
-    def _render_logs_autoscroll(text: str, height_px: int = 420) -> None:
-        safe = _html.escape(text or "(暂无日志)")
-        # 用 app_id 做容器 id，避免页面上多个组件冲突
-        dom_id = f"logbox-{selected_app_id}"
-        components.html(
-            f"""
-            <div id="{dom_id}" style="
-                height: {height_px}px;
-                overflow-y: auto;
-                border: 1px solid rgba(49, 51, 63, 0.2);
-                border-radius: 6px;
-                padding: 12px;
-                background: rgba(240, 242, 246, 0.6);
-                font-family: ui-monospace, SFMono-Regular, Menlo, Monaco, Consolas, 'Liberation Mono', 'Courier New', monospace;
-                font-size: 12px;
-                white-space: pre;
-            ">{safe}</div>
-            <script>
-              (function() {{
-                const el = document.getElementById("{dom_id}");
-                if (el) {{
-                  el.scrollTop = el.scrollHeight;
-                }}
-              }})();
-            </script>
-            """,
-            height=height_px + 30,
-        )
-
-    _render_logs_autoscroll(logs)
-
-
+    st.fragment(_log_panel, run_every=float(interval) if auto else None)(api_base, selected_app_id, tail)
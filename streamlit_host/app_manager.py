@@ -1,27 +1,66 @@
 from __future__ import annotations
 
 import os
+import queue
+import re
 import shutil
+import signal
 import subprocess
 import threading
 import time
 import uuid
+import venv
+from contextlib import contextmanager
 from datetime import datetime
+from operator import attrgetter
 from pathlib import Path
 from typing import Optional
 
 import psutil
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
 from .config import Settings
 from .models import AppMeta, AppStatus
-from .utils import is_port_free, sha256_file
+from .utils import copy_file_sha256, is_pid_alive, is_port_free, ports_in_use, sha256_file
+
+
+_WORD_FULL = (1 << 64) - 1
+# 二级摘要位图中每一位覆盖 512 个端口（8 个 64 位字 / 64 字节）
+_GROUP_BYTES = 64
+_GROUP_FULL = b"\xff" * _GROUP_BYTES
+# 后台准备/启动应用的工作线程数，以及同时运行的 pip 安装数上限
+_PROVISION_WORKERS = 8
+_PIP_CONCURRENCY = 2
+# requirements.txt 中以 streamlit 为包名的行（可带版本约束/extras/环境标记），不匹配 streamlit-xxx 等其他包和注释行
+_STREAMLIT_REQ_RE = re.compile(rb"(?mi)^[ \t]*streamlit(?:[ \t\r\[<>=!~;@]|$)")
+
+# (整秒, 该秒的 "YYYY-MM-DDTHH:MM:SS" 前缀)；整体替换元组，多线程读写无需加锁
+_ts_cache: tuple[int, str] = (0, "")
+
+
+def _log_ts() -> str:
+    """
+    日志行的 UTC 时间戳，总是带 6 位微秒（与 datetime.isoformat() 不同，微秒为 0 时也不省略，日志列宽固定）：
+    秒级前缀按秒缓存，同一秒内只补微秒部分。
+    """
+    global _ts_cache
+    now = time.time()
+    sec = int(now)
+    cached = _ts_cache
+    if cached[0] != sec:
+        cached = _ts_cache = (sec, time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(sec)))
+    return f"{cached[1]}.{int((now - sec) * 1_000_000):06d}"
 
 
 class AppManager:
     """
     负责：
     - 每个应用独立目录：data/apps/<app_id>/
-    - 创建 venv、pip install
+    - 创建 venv、pip install（相同 requirements 的应用共用 data/venvs/<sha256>/）
     - 分配端口并启动 streamlit 子进程
     - 读写 meta.json、写入 run.log
     """
@@ -30,7 +69,36 @@ class AppManager:
         self.settings = settings
         self.apps_dir = (settings.data_dir / "apps").resolve()
         self.apps_dir.mkdir(parents=True, exist_ok=True)
+        self.venvs_dir = (settings.data_dir / "venvs").resolve()
+        self.venvs_dir.mkdir(parents=True, exist_ok=True)
         self._lock = threading.Lock()
+        # 无 fcntl（Windows）时，共享 venv 的构建只能在进程内互斥
+        self._venv_mutex = threading.Lock()
+        # 若宿主机装有 uv，用它代替 venv 内的 pip 安装依赖（单进程并行解析/下载，速度快很多）
+        self._uv = shutil.which("uv")
+        # 端口位图：第 i 位对应 port_min + i，置位表示已被本进程分配；
+        # _next_free 为环形游标，释放的端口不会被立刻复用
+        # 位图按 512 位分组对齐，便于整字扫描；末尾超出端口范围的填充位预先置位，永不分配。
+        # _port_summary 为二级位图：某组 512 个端口全部已分配时对应位置位，扫描时整组跳过
+        self._port_count = settings.port_max - settings.port_min + 1
+        groups = (self._port_count + 511) // 512
+        self._port_bitmap = bytearray(groups * _GROUP_BYTES)
+        self._port_summary = bytearray((groups + 7) // 8)
+        for idx in range(self._port_count, len(self._port_bitmap) * 8):
+            self._port_bitmap[idx >> 3] |= 1 << (idx & 7)
+        self._next_free = 0
+        # 已解析的 meta 缓存：app_id -> ((st_mtime_ns, st_size), AppMeta)；文件未变时免去 JSON 解析与校验。
+        # 命中时只做单次 dict 读取，不加锁；写文件 + stat + 更新缓存、以及未命中时的重新解析都在 _meta_lock 下进行，
+        # 保证缓存中的对象与其 key 对应的是同一次写入（API 线程与后台工作线程可能同时保存同一个应用）
+        self._meta_cache: dict[str, tuple[tuple[int, int], AppMeta]] = {}
+        self._meta_lock = threading.Lock()
+        # 固定数量的后台线程从队列中取 app_id 执行 _provision_and_start；
+        # 用守护线程而不是 ThreadPoolExecutor，服务退出时不必等待正在进行的 pip 安装。
+        # pip 安装另由信号量限流，venv 已就绪的应用启动不会排在大量安装之后
+        self._provision_queue: queue.SimpleQueue[str] = queue.SimpleQueue()
+        self._pip_sem = threading.Semaphore(_PIP_CONCURRENCY)
+        for i in range(_PROVISION_WORKERS):
+            threading.Thread(target=self._provision_worker, name=f"app-provision-{i}", daemon=True).start()
 
     def _app_dir(self, app_id: str) -> Path:
         return (self.apps_dir / app_id).resolve()
@@ -41,31 +109,54 @@ class AppManager:
     def _log_path(self, app_id: str) -> Path:
         return self._app_dir(app_id) / "run.log"
 
-    def _load_meta(self, app_id: str) -> AppMeta:
-        meta_path = self._meta_path(app_id)
-        if not meta_path.exists():
-            raise FileNotFoundError(f"app not found: {app_id}")
-        return AppMeta.model_validate_json(meta_path.read_text(encoding="utf-8"))
+    def _load_meta(self, app_id: str, meta_path: Optional[Path] = None) -> AppMeta:
+        """
+        读取 meta.json；mtime 与大小都未变化时直接返回缓存对象的副本（调用方可随意修改）。
+        """
+        if meta_path is None:
+            meta_path = self._meta_path(app_id)
+        try:
+            st = meta_path.stat()
+        except FileNotFoundError:
+            self._meta_cache.pop(app_id, None)
+            raise FileNotFoundError(f"app not found: {app_id}") from None
+        cached = self._meta_cache.get(app_id)
+        if cached is not None and cached[0] == (st.st_mtime_ns, st.st_size):
+            return cached[1].model_copy()
+        with self._meta_lock:
+            # 持锁后重新 stat：此时没有进行中的写入，读到的内容与 key 一致
+            try:
+                st = meta_path.stat()
+                data = meta_path.read_bytes()
+            except FileNotFoundError:
+                self._meta_cache.pop(app_id, None)
+                raise FileNotFoundError(f"app not found: {app_id}") from None
+            meta = AppMeta.model_validate_json(data)
+            self._meta_cache[app_id] = ((st.st_mtime_ns, st.st_size), meta.model_copy())
+        return meta
 
     def _save_meta(self, meta: AppMeta) -> None:
         meta.updated_at = datetime.utcnow()
         meta_path = self._meta_path(meta.app_id)
-        meta_path.write_text(meta.model_dump_json(indent=2), encoding="utf-8")
+        data = meta.model_dump_json(indent=2)
+        with self._meta_lock:
+            meta_path.write_text(data, encoding="utf-8")
+            st = meta_path.stat()
+            self._meta_cache[meta.app_id] = ((st.st_mtime_ns, st.st_size), meta.model_copy())
 
     def list_apps(self) -> list[AppMeta]:
         metas: list[AppMeta] = []
-        for p in self.apps_dir.iterdir():
-            if not p.is_dir():
-                continue
-            meta_path = p / "meta.json"
-            if not meta_path.exists():
-                continue
-            try:
-                meta = AppMeta.model_validate_json(meta_path.read_text(encoding="utf-8"))
-                metas.append(self._refresh_status(meta))
-            except Exception:
-                continue
-        metas.sort(key=lambda m: m.created_at, reverse=True)
+        # scandir 的 DirEntry 自带文件类型，无需逐个 stat；meta 路径直接拼接，不再逐个 resolve
+        with os.scandir(self.apps_dir) as it:
+            for e in it:
+                if not e.is_dir(follow_symlinks=False):
+                    continue
+                try:
+                    meta = self._load_meta(e.name, Path(e.path, "meta.json"))
+                    metas.append(self._refresh_status(meta))
+                except Exception:
+                    continue
+        metas.sort(key=attrgetter("created_at"), reverse=True)
         return metas
 
     def get_app(self, app_id: str) -> AppMeta:
@@ -74,20 +165,16 @@ class AppManager:
 
     def _refresh_status(self, meta: AppMeta) -> AppMeta:
         if meta.pid:
-            if psutil.pid_exists(meta.pid):
-                try:
-                    p = psutil.Process(meta.pid)
-                    if p.is_running() and p.status() != psutil.STATUS_ZOMBIE:
-                        if meta.status not in (AppStatus.running, AppStatus.starting):
-                            meta.status = AppStatus.running
-                            self._save_meta(meta)
-                        return meta
-                except Exception:
-                    pass
+            if is_pid_alive(meta.pid):
+                if meta.status not in (AppStatus.running, AppStatus.starting):
+                    meta.status = AppStatus.running
+                    self._save_meta(meta)
+                return meta
             # pid 不存在或不可用
             if meta.status in (AppStatus.running, AppStatus.starting):
                 meta.status = AppStatus.stopped
                 meta.pid = None
+                self._release_port(meta.port)
                 self._save_meta(meta)
         return meta
 
@@ -104,8 +191,8 @@ class AppManager:
         # 保存用户文件
         req_dst = app_dir / "requirements.txt"
         app_dst = app_dir / "app.py"
-        shutil.copyfile(requirements_path, req_dst)
-        shutil.copyfile(app_py_path, app_dst)
+        requirements_sha256 = copy_file_sha256(requirements_path, req_dst)
+        app_sha256 = copy_file_sha256(app_py_path, app_dst)
 
         port = self._alloc_port()
         meta = AppMeta(
@@ -113,14 +200,13 @@ class AppManager:
             name=name,
             status=AppStatus.starting,
             port=port,
-            requirements_sha256=sha256_file(req_dst),
-            app_sha256=sha256_file(app_dst),
+            requirements_sha256=requirements_sha256,
+            app_sha256=app_sha256,
         )
         self._save_meta(meta)
 
-        # 异步启动（后台线程）
-        t = threading.Thread(target=self._provision_and_start, args=(app_id,), daemon=True)
-        t.start()
+        # 异步启动（交给后台工作线程）
+        self._provision_queue.put(app_id)
         return meta
 
     def update_app(
@@ -152,12 +238,10 @@ class AppManager:
             meta.name = name.strip()
 
         if requirements_path is not None:
-            shutil.copyfile(requirements_path, req_dst)
-            meta.requirements_sha256 = sha256_file(req_dst)
+            meta.requirements_sha256 = copy_file_sha256(requirements_path, req_dst)
 
         if app_py_path is not None:
-            shutil.copyfile(app_py_path, app_dst)
-            meta.app_sha256 = sha256_file(app_dst)
+            meta.app_sha256 = copy_file_sha256(app_py_path, app_dst)
 
         # 清理错误并重启
         meta.error = None
@@ -166,8 +250,7 @@ class AppManager:
         meta.port = self._alloc_port()
         self._save_meta(meta)
 
-        t = threading.Thread(target=self._provision_and_start, args=(app_id,), daemon=True)
-        t.start()
+        self._provision_queue.put(app_id)
         return meta
 
     def stop_app(self, app_id: str) -> AppMeta:
@@ -177,6 +260,10 @@ class AppManager:
             self._append_log(app_id, f"stopping pid={meta.pid}")
             self._kill_pid_tree(meta.pid)
             meta.pid = None
+        # 只释放仍在占用中的端口（已停止的应用其端口可能已分配给别的应用）；
+        # 端口号保留在 meta 中，再次启动时尽量复用
+        if meta.status in (AppStatus.running, AppStatus.starting):
+            self._release_port(meta.port)
         meta.status = AppStatus.stopped
         self._save_meta(meta)
         self._append_log(app_id, "stopped")
@@ -193,10 +280,14 @@ class AppManager:
         if meta.status == AppStatus.running and meta.pid:
             return meta
 
+        # 仍在启动中（或无 pid 的 running）的应用已在位图中持有自己的端口：先释放，
+        # 否则下面的 _claim_port 会因为自己占着的位而失败，另分配一个端口，旧位永远不会被释放
+        if meta.status in (AppStatus.running, AppStatus.starting):
+            self._release_port(meta.port)
         meta.pid = None
         meta.error = None
         port = meta.port
-        if port is None or not is_port_free(self.settings.host, int(port)):
+        if port is None or not self._claim_port(int(port)):
             port = self._alloc_port()
         meta.port = int(port)
         meta.status = AppStatus.starting
@@ -207,8 +298,7 @@ class AppManager:
         else:
             self._append_log(app_id, f"starting (manual) port={meta.port}")
 
-        t = threading.Thread(target=self._provision_and_start, args=(app_id,), daemon=True)
-        t.start()
+        self._provision_queue.put(app_id)
         return meta
 
     def delete_app(self, app_id: str) -> None:
@@ -216,39 +306,256 @@ class AppManager:
             self.stop_app(app_id)
         except FileNotFoundError:
             return
+        self._unlink_shared_venv(app_id)
         shutil.rmtree(self._app_dir(app_id), ignore_errors=True)
+        self._meta_cache.pop(app_id, None)
 
     def tail_logs(self, app_id: str, tail: int = 200) -> str:
+        text, _, _ = self.read_logs(app_id, partial=True)
+        return "\n".join(text.splitlines()[-tail:])
+
+    def read_logs(self, app_id: str, since: int = 0, partial: bool = False) -> tuple[str, int, bool]:
+        """
+        从字节偏移 since 开始读取日志，返回 (文本, 下一次读取的偏移, 是否从头重读)。
+        默认只返回完整的行，未写完的半行留到下一次读取；partial=True 时连同末尾的半行（进度条、提示符等）一起返回，
+        下一次读取的偏移仍停在最后一个完整行之后。
+        """
         log_path = self._log_path(app_id)
         if not log_path.exists():
-            return ""
-        lines = log_path.read_text(encoding="utf-8", errors="replace").splitlines()
-        return "\n".join(lines[-tail:])
+            return "", 0, False
+        reset = False
+        with log_path.open("rb") as f:
+            size = f.seek(0, os.SEEK_END)
+            # 偏移超过文件大小说明日志被重建，从头读取，并告知调用方清空已有内容
+            if since < 0 or since > size:
+                since = 0
+                reset = True
+            f.seek(since)
+            data = f.read()
+        end = data.rfind(b"\n") + 1
+        text = data if partial else data[:end]
+        return text.decode("utf-8", errors="replace"), since + end, reset
 
     def _alloc_port(self) -> int:
-        with self._lock:
-            for port in range(self.settings.port_min, self.settings.port_max + 1):
-                if is_port_free(self.settings.host, port):
+        """
+        从 _next_free 开始环形查找位图中的空闲位，再排除系统中已被占用的端口
+        （Linux 读 /proc/net/tcp，其他平台对候选端口做真实的 bind 探测）。
+        _lock 只保护位图读写：候选位先置位占住再释放锁做探测，
+        并发的创建/启动不会因为彼此的 bind 系统调用而串行等待。
+        """
+        # 探测失败（被外部进程占用）的候选先保持置位，保证本轮扫描继续向后推进，结束后统一清除
+        rejected: list[int] = []
+        # Linux 上一次读取 /proc/net/tcp 得到全部已占用端口，候选端口不再逐个 bind 探测
+        busy = ports_in_use()
+        try:
+            while True:
+                with self._lock:
+                    start = self._next_free
+                    idx = self._find_free_port(start, self._port_count)
+                    if idx is None:
+                        idx = self._find_free_port(0, start)
+                    if idx is None:
+                        raise RuntimeError("no free ports available")
+                    self._mark_port(idx)
+                    self._next_free = (idx + 1) % self._port_count
+                port = self.settings.port_min + idx
+                if (port not in busy) if busy is not None else is_port_free(self.settings.host, port):
                     return port
-        raise RuntimeError("no free ports available")
+                rejected.append(idx)
+        finally:
+            if rejected:
+                with self._lock:
+                    for idx in rejected:
+                        self._unmark_port(idx)
+
+    def _find_free_port(self, lo: int, hi: int) -> Optional[int]:
+        """
+        在位图下标 [lo, hi) 中查找第一个空闲位（调用方需持有 _lock）。
+        先看二级位图跳过已满的 512 位分组，再按 64 位字扫描：已满的字整体跳过，
+        字内用 lowest-set-bit 直接定位空闲位。
+        """
+        with memoryview(self._port_bitmap) as mv:
+            wi = lo >> 6
+            while wi * 64 < hi:
+                g = wi >> 3
+                if self._port_summary[g >> 3] >> (g & 7) & 1:
+                    wi = (g + 1) << 3
+                    continue
+                base = wi * 64
+                word = int.from_bytes(mv[wi * 8 : wi * 8 + 8], "little")
+                if base < lo:
+                    word |= (1 << (lo - base)) - 1
+                if base + 64 > hi:
+                    word |= _WORD_FULL & ~((1 << (hi - base)) - 1)
+                if word != _WORD_FULL:
+                    free = ~word & _WORD_FULL
+                    return base + (free & -free).bit_length() - 1
+                wi += 1
+        return None
+
+    def _mark_port(self, idx: int) -> None:
+        self._port_bitmap[idx >> 3] |= 1 << (idx & 7)
+        g = idx >> 9
+        if self._port_bitmap[g * _GROUP_BYTES : (g + 1) * _GROUP_BYTES] == _GROUP_FULL:
+            self._port_summary[g >> 3] |= 1 << (g & 7)
+
+    def _unmark_port(self, idx: int) -> None:
+        self._port_bitmap[idx >> 3] &= ~(1 << (idx & 7)) & 0xFF
+        g = idx >> 9
+        self._port_summary[g >> 3] &= ~(1 << (g & 7)) & 0xFF
+
+    def _claim_port(self, port: int) -> bool:
+        """
+        尝试继续占用指定端口（如重启时复用原端口）：未被分配且可 bind 时置位并返回 True。
+        """
+        idx = port - self.settings.port_min
+        if not 0 <= idx < self._port_count:
+            return is_port_free(self.settings.host, port)
+        with self._lock:
+            if self._port_bitmap[idx >> 3] >> (idx & 7) & 1:
+                return False
+            self._mark_port(idx)
+        if is_port_free(self.settings.host, port):
+            return True
+        with self._lock:
+            self._unmark_port(idx)
+        return False
+
+    def _release_port(self, port: Optional[int]) -> None:
+        # 只清位，不回拨 _next_free：下一次分配会继续向后找，避免旧客户端连到新应用
+        if port is None:
+            return
+        idx = int(port) - self.settings.port_min
+        if not 0 <= idx < self._port_count:
+            return
+        with self._lock:
+            self._unmark_port(idx)
 
     def _venv_paths(self, app_id: str) -> tuple[Path, Path, Path]:
+        venv_dir = self._app_dir(app_id) / "venv"
+        return (venv_dir, *self._venv_bins(venv_dir))
+
+    def _venv_bins(self, venv_dir: Path) -> tuple[Path, Path]:
+        if os.name == "nt":
+            return venv_dir / "Scripts" / "python.exe", venv_dir / "Scripts" / "pip.exe"
+        return venv_dir / "bin" / "python", venv_dir / "bin" / "pip"
+
+    @contextmanager
+    def _venv_lock(self, sha: str):
+        """
+        共享 venv 的构建与引用计数按 requirements 哈希互斥；有 fcntl 时用文件锁，多进程部署也安全。
+        """
+        with (self.venvs_dir / f"{sha}.lock").open("a") as f:
+            if fcntl is None:
+                with self._venv_mutex:
+                    yield
+            else:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                yield
+
+    def _ensure_venv(self, app_id: str, sha: Optional[str], req_path: Path) -> None:
+        """
+        准备应用的 venv：相同 requirements_sha256 的应用共用 data/venvs/<sha>/，
+        apps/<id>/venv 只是指向它的符号链接，依赖只安装一次。
+        data/venvs/<sha>/users.txt 记录引用该 venv 的应用，最后一个应用删除时回收。
+        """
         app_dir = self._app_dir(app_id)
         venv_dir = app_dir / "venv"
-        if os.name == "nt":
-            python_bin = venv_dir / "Scripts" / "python.exe"
-            pip_bin = venv_dir / "Scripts" / "pip.exe"
-        else:
-            python_bin = venv_dir / "bin" / "python"
-            pip_bin = venv_dir / "bin" / "pip"
-        return venv_dir, python_bin, pip_bin
+        # 旧版本留下的独立 venv：沿用原来的就地安装
+        if venv_dir.exists() and not venv_dir.is_symlink():
+            self._build_venv(app_id, venv_dir, req_path, app_dir)
+            return
 
-    def _append_log(self, app_id: str, msg: str) -> None:
+        sha = sha or sha256_file(req_path)
+        shared = self.venvs_dir / sha
+        if venv_dir.is_symlink():
+            if Path(os.readlink(venv_dir)) == shared and (shared / ".ready").exists():
+                return
+            # requirements 已变更（或共享 venv 已失效）：先解除旧引用
+            self._unlink_shared_venv(app_id)
+
+        with self._venv_lock(sha):
+            if not (shared / ".ready").exists():
+                shutil.rmtree(shared, ignore_errors=True)
+                try:
+                    self._build_venv(app_id, shared, req_path, app_dir)
+                except Exception:
+                    shutil.rmtree(shared, ignore_errors=True)
+                    raise
+                (shared / ".ready").touch()
+            users_path = shared / "users.txt"
+            users = set(users_path.read_text(encoding="utf-8").split()) if users_path.exists() else set()
+            users.add(app_id)
+            users_path.write_text("\n".join(sorted(users)) + "\n", encoding="utf-8")
+
+        try:
+            os.symlink(shared, venv_dir, target_is_directory=True)
+        except OSError as e:
+            # 不支持符号链接（如未开启开发者模式的 Windows）：退回到应用独立 venv
+            self._append_log(app_id, f"symlink to shared venv failed ({e}), building a private venv")
+            self._release_venv_user(sha, app_id)
+            self._build_venv(app_id, venv_dir, req_path, app_dir)
+            return
+        self._append_log(app_id, f"using shared venv {shared}")
+
+    def _build_venv(self, app_id: str, venv_dir: Path, req_path: Path, app_dir: Path) -> None:
+        python_bin, pip_bin = self._venv_bins(venv_dir)
+
+        # 创建 venv
+        if not venv_dir.exists():
+            # 进程内创建，省去再启动一个解释器；用 uv 安装时 venv 内不需要 pip
+            self._append_log(app_id, f"creating venv {venv_dir}")
+            venv.EnvBuilder(with_pip=not self._uv).create(venv_dir)
+
+        # 升级 pip & 安装依赖（uv 不依赖 venv 内的 pip，无需升级）
+        if not self._uv:
+            self._pip_install(app_id, python_bin, pip_bin, ["--upgrade", "pip"], cwd=app_dir, timeout=15 * 60)
+        # 确保 streamlit 存在（即使用户 requirements.txt 为空）
+        if not self._requirements_has_streamlit(req_path):
+            self._pip_install(app_id, python_bin, pip_bin, ["streamlit"], cwd=app_dir, timeout=20 * 60)
+
+        if req_path.exists() and req_path.read_text(encoding="utf-8", errors="ignore").strip():
+            self._pip_install(
+                app_id,
+                python_bin,
+                pip_bin,
+                ["-r", str(req_path)],
+                cwd=app_dir,
+                timeout=30 * 60,
+            )
+
+    def _unlink_shared_venv(self, app_id: str) -> None:
+        venv_dir = self._app_dir(app_id) / "venv"
+        if not venv_dir.is_symlink():
+            return
+        shared = Path(os.readlink(venv_dir))
+        venv_dir.unlink()
+        self._release_venv_user(shared.name, app_id)
+
+    def _release_venv_user(self, sha: str, app_id: str) -> None:
+        shared = self.venvs_dir / sha
+        with self._venv_lock(sha):
+            users_path = shared / "users.txt"
+            if not users_path.exists():
+                return
+            users = set(users_path.read_text(encoding="utf-8").split())
+            users.discard(app_id)
+            if users:
+                users_path.write_text("\n".join(sorted(users)) + "\n", encoding="utf-8")
+            else:
+                shutil.rmtree(shared, ignore_errors=True)
+
+    def _open_log(self, app_id: str):
         log_path = self._log_path(app_id)
-        ts = datetime.utcnow().isoformat()
         log_path.parent.mkdir(parents=True, exist_ok=True)
-        with log_path.open("a", encoding="utf-8") as f:
-            f.write(f"[{ts}] {msg}\n")
+        return log_path.open("a", encoding="utf-8")
+
+    def _write_log(self, f, msg: str) -> None:
+        f.write(f"[{_log_ts()}] {msg}\n")
+
+    def _append_log(self, app_id: str, msg: str) -> None:
+        with self._open_log(app_id) as f:
+            self._write_log(f, msg)
 
     def _public_app_url(self, app_id: str) -> str | None:
         """
@@ -268,31 +575,60 @@ class AppManager:
         env: Optional[dict[str, str]] = None,
         timeout: Optional[int] = None,
     ) -> None:
-        self._append_log(app_id, f"$ {' '.join(cmd)}")
-        p = subprocess.Popen(
-            cmd,
-            cwd=str(cwd) if cwd else None,
-            env=env,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
-            bufsize=1,
-        )
+        # 子进程 stdout/stderr 直接写入 run.log（与 streamlit 进程相同），输出不经过本进程
+        with self._open_log(app_id) as log_f:
+            self._write_log(log_f, f"$ {' '.join(cmd)}")
+            log_f.flush()
+            p = subprocess.Popen(
+                cmd,
+                cwd=str(cwd) if cwd else None,
+                env=env,
+                stdout=log_f,
+                stderr=subprocess.STDOUT,
+            )
         try:
-            start = time.time()
-            assert p.stdout is not None
-            for line in p.stdout:
-                self._append_log(app_id, line.rstrip("\n"))
-                if timeout is not None and (time.time() - start) > timeout:
-                    raise TimeoutError(f"command timeout after {timeout}s")
-            code = p.wait()
-            if code != 0:
-                raise RuntimeError(f"command failed (exit {code}): {' '.join(cmd)}")
+            code = p.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            raise TimeoutError(f"command timeout after {timeout}s") from None
         finally:
             try:
                 p.kill()
             except Exception:
                 pass
+        if code != 0:
+            raise RuntimeError(f"command failed (exit {code}): {' '.join(cmd)}")
+
+    def _pip_install(
+        self,
+        app_id: str,
+        python_bin: Path,
+        pip_bin: Path,
+        args: list[str],
+        cwd: Optional[Path] = None,
+        timeout: Optional[int] = None,
+    ) -> None:
+        """
+        向应用 venv 安装依赖。所有应用共用同一个下载/wheel 缓存目录，
+        相同依赖只需下载、构建一次；有 uv 时改用 uv pip install --python 指向该 venv。
+        """
+        env = os.environ.copy()
+        env["PIP_CACHE_DIR"] = str(self.settings.pip_cache_dir)
+        env["UV_CACHE_DIR"] = str(self.settings.pip_cache_dir / "uv")
+        if self._uv:
+            cmd = [self._uv, "pip", "install", "--python", str(python_bin), *args]
+        else:
+            cmd = [str(pip_bin), "install", *args]
+        with self._pip_sem:
+            self._run_cmd(app_id, cmd, cwd=cwd, env=env, timeout=timeout)
+
+    def _provision_worker(self) -> None:
+        while True:
+            app_id = self._provision_queue.get()
+            try:
+                self._provision_and_start(app_id)
+            except Exception:
+                # 如排队期间应用已被删除；不能让工作线程退出
+                pass
 
     def _provision_and_start(self, app_id: str) -> None:
         meta = self._load_meta(app_id)
@@ -300,6 +636,7 @@ class AppManager:
             # 如果 create/update 已经分配过端口，尽量复用；否则再分配
             port = meta.port
             if port is None or not is_port_free(self.settings.host, int(port)):
+                self._release_port(port)
                 port = self._alloc_port()
                 meta.port = port
             meta.status = AppStatus.starting
@@ -309,25 +646,8 @@ class AppManager:
             req_path = app_dir / "requirements.txt"
             app_path = app_dir / "app.py"
 
-            venv_dir, python_bin, pip_bin = self._venv_paths(app_id)
-
-            # 创建 venv
-            if not venv_dir.exists():
-                self._run_cmd(app_id, [os.sys.executable, "-m", "venv", str(venv_dir)], cwd=app_dir)
-
-            # 升级 pip & 安装依赖
-            self._run_cmd(app_id, [str(pip_bin), "install", "--upgrade", "pip"], cwd=app_dir, timeout=15 * 60)
-            # 确保 streamlit 存在（即使用户 requirements.txt 为空）
-            if not self._requirements_has_streamlit(req_path):
-                self._run_cmd(app_id, [str(pip_bin), "install", "streamlit"], cwd=app_dir, timeout=20 * 60)
-
-            if req_path.exists() and req_path.read_text(encoding="utf-8", errors="ignore").strip():
-                self._run_cmd(
-                    app_id,
-                    [str(pip_bin), "install", "-r", str(req_path)],
-                    cwd=app_dir,
-                    timeout=30 * 60,
-                )
+            self._ensure_venv(app_id, meta.requirements_sha256, req_path)
+            _, python_bin, _ = self._venv_paths(app_id)
 
             # 启动 streamlit（独立进程组，便于 stop）
             env = os.environ.copy()
@@ -353,27 +673,19 @@ class AppManager:
                 "false",
             ]
 
-            log_f = self._log_path(app_id).open("a", encoding="utf-8")
+            log_f = self._open_log(app_id)
             try:
-                if os.name == "nt":
-                    proc = subprocess.Popen(
-                        cmd,
-                        cwd=str(app_dir),
-                        env=env,
-                        stdout=log_f,
-                        stderr=subprocess.STDOUT,
-                        text=True,
-                    )
-                else:
-                    proc = subprocess.Popen(
-                        cmd,
-                        cwd=str(app_dir),
-                        env=env,
-                        stdout=log_f,
-                        stderr=subprocess.STDOUT,
-                        text=True,
-                        preexec_fn=os.setsid,
-                    )
+                # start_new_session 等价于 preexec_fn=os.setsid，但不需要在子进程里执行 Python 代码，
+                # subprocess 可以走 vfork 快速路径（Windows 上忽略该参数）
+                proc = subprocess.Popen(
+                    cmd,
+                    cwd=str(app_dir),
+                    env=env,
+                    stdout=log_f,
+                    stderr=subprocess.STDOUT,
+                    text=True,
+                    start_new_session=True,
+                )
             finally:
                 # 子进程已继承 fd，父进程可关闭句柄避免泄漏
                 try:
@@ -392,10 +704,20 @@ class AppManager:
         except Exception as e:
             meta.status = AppStatus.failed
             meta.error = str(e)
+            self._release_port(meta.port)
             self._save_meta(meta)
             self._append_log(app_id, f"FAILED: {e}")
 
     def _kill_pid_tree(self, pid: int) -> None:
+        if os.name != "nt":
+            try:
+                pgid = os.getpgid(pid)
+            except ProcessLookupError:
+                return
+            # streamlit 以新会话启动，自成进程组（pgid == pid）：整组发信号即覆盖全部子孙进程
+            if pgid == pid:
+                self._kill_pgroup(pgid)
+                return
         try:
             parent = psutil.Process(pid)
         except Exception:
@@ -418,20 +740,31 @@ class AppManager:
             except Exception:
                 pass
 
+    def _kill_pgroup(self, pgid: int) -> None:
+        """
+        先 SIGTERM 让 streamlit 优雅退出，组长最多等 3 秒；之后对整组补一次 SIGKILL，清理残留的子进程。
+        """
+        try:
+            os.killpg(pgid, signal.SIGTERM)
+        except ProcessLookupError:
+            return
+        deadline = time.monotonic() + 3
+        while is_pid_alive(pgid) and time.monotonic() < deadline:
+            time.sleep(0.1)
+        try:
+            os.killpg(pgid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        # 若是本进程的子进程，回收掉，避免留下僵尸
+        try:
+            os.waitpid(pgid, 0)
+        except ChildProcessError:
+            pass
+
     def _requirements_has_streamlit(self, req_path: Path) -> bool:
         if not req_path.exists():
             return False
         try:
-            txt = req_path.read_text(encoding="utf-8", errors="ignore").lower()
+            return _STREAMLIT_REQ_RE.search(req_path.read_bytes()) is not None
         except Exception:
             return False
-        # 粗略判断：包含 "streamlit" 即认为用户显式指定/依赖了
-        for line in txt.splitlines():
-            s = line.strip()
-            if not s or s.startswith("#"):
-                continue
-            if s.startswith("streamlit") or " streamlit" in s or "streamlit" in s:
-                return True
-        return False
-
-
@@ -11,6 +11,7 @@ class Settings:
     port_min: int
     port_max: int
     host: str
+    pip_cache_dir: Path
 
 
 def get_settings() -> Settings:
@@ -18,6 +19,7 @@ def get_settings() -> Settings:
     port_min = int(os.getenv("STREAMLIT_HOST_PORT_MIN", "8501"))
     port_max = int(os.getenv("STREAMLIT_HOST_PORT_MAX", "8999"))
     host = os.getenv("STREAMLIT_HOST_BIND", "0.0.0.0")
-    return Settings(data_dir=data_dir, port_min=port_min, port_max=port_max, host=host)
+    pip_cache_dir = Path(os.getenv("STREAMLIT_HOST_PIP_CACHE", str(data_dir / "pip-cache"))).resolve()
+    return Settings(data_dir=data_dir, port_min=port_min, port_max=port_max, host=host, pip_cache_dir=pip_cache_dir)
 
 
@@ -2,21 +2,47 @@ from __future__ import annotations
 
 import os
 import tempfile
+import time
+from contextlib import asynccontextmanager
 from pathlib import Path
 
 from fastapi import APIRouter, FastAPI, File, Form, HTTPException, Request, UploadFile, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+    from fastapi.responses import ORJSONResponse
+except ImportError:  # orjson 未安装时退回标准库 json
+    orjson = None
 
 from .app_manager import AppManager
 from .config import get_settings
 from .models import AppMeta, CreateAppResponse, StartAppResponse, StopAppResponse
-from .proxy import proxy_http, proxy_ws
+from .proxy import aclose_client, proxy_http, proxy_ws
 
 
 settings = get_settings()
 manager = AppManager(settings)
 
-app = FastAPI(title="Streamlit Host", version="0.1.0")
+# app_id -> (查询时间, 端口)；启动/停止/修改/删除应用时主动失效
+_PORT_TTL = 1.0
+_port_cache: dict[str, tuple[float, int]] = {}
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    yield
+    await aclose_client()
+
+
+app = FastAPI(
+    title="Streamlit Host",
+    version="0.1.0",
+    lifespan=lifespan,
+    # 管理 API 的 JSON 响应优先用 orjson 序列化；反代响应是原始字节，不受影响
+    default_response_class=ORJSONResponse if orjson is not None else JSONResponse,
+)
 api = APIRouter(prefix="/api")
 
 # 私有部署场景通常不需要 CORS；为了便于对接内部面板，默认放开（也可自行移除/收紧）
@@ -51,12 +77,21 @@ def get_app(app_id: str) -> AppMeta:
 
 
 @api.get("/apps/{app_id}/logs")
-def get_logs(app_id: str, tail: int = 200) -> dict:
+def get_logs(app_id: str, tail: int = 200, since: int | None = None) -> dict:
+    """
+    不带 since：返回最后 tail 行（含末尾未写完的半行）；带 since：只返回该字节偏移之后新增的完整行。
+    两种方式都会返回 next_offset，供下一次增量读取；reset 为 true 表示日志已被重建、从头返回，客户端应清空已有内容。
+    末尾半行的 next_offset 仍指向该行开头，下一次增量读取会返回补全后的整行。
+    """
     try:
         _ = manager.get_app(app_id)
     except FileNotFoundError:
         raise HTTPException(status_code=404, detail="app not found")
-    return {"app_id": app_id, "logs": manager.tail_logs(app_id, tail=tail)}
+    text, next_offset, reset = manager.read_logs(app_id, since=since or 0, partial=since is None)
+    if since is None:
+        # 保留换行符，客户端据此判断最后一行是否完整
+        text = "".join(text.splitlines(keepends=True)[-tail:])
+    return {"app_id": app_id, "logs": text, "next_offset": next_offset, "reset": reset}
 
 
 def _public_access_url(app_id: str) -> str | None:
@@ -129,9 +164,11 @@ async def update_app(
             app_in = app_path
 
         try:
-            return manager.update_app(app_id=app_id, name=name, requirements_path=req_in, app_py_path=app_in)
+            meta = manager.update_app(app_id=app_id, name=name, requirements_path=req_in, app_py_path=app_in)
         except FileNotFoundError:
             raise HTTPException(status_code=404, detail="app not found")
+        _port_cache.pop(app_id, None)
+        return meta
 
 
 @api.post("/apps/{app_id}/stop", response_model=StopAppResponse)
@@ -140,6 +177,7 @@ def stop_app(app_id: str) -> StopAppResponse:
         meta = manager.stop_app(app_id)
     except FileNotFoundError:
         raise HTTPException(status_code=404, detail="app not found")
+    _port_cache.pop(app_id, None)
     return StopAppResponse(app_id=meta.app_id, status=meta.status)
 
 
@@ -149,12 +187,14 @@ def start_app(app_id: str) -> StartAppResponse:
         meta = manager.start_app(app_id)
     except FileNotFoundError:
         raise HTTPException(status_code=404, detail="app not found")
+    _port_cache.pop(app_id, None)
     return StartAppResponse(app_id=meta.app_id, status=meta.status, port=meta.port)
 
 
 @api.delete("/apps/{app_id}")
 def delete_app(app_id: str) -> dict:
     manager.delete_app(app_id)
+    _port_cache.pop(app_id, None)
     return {"deleted": True, "app_id": app_id}
 
 
@@ -186,10 +226,17 @@ async def app_http_root(app_id: str, request: Request):
 
 
 def _app_port(app_id: str) -> int:
+    # 每个反代请求/WS 握手都会调用：短时间内直接复用上次查到的端口，不再每次读 meta 并探测进程
+    now = time.monotonic()
+    hit = _port_cache.get(app_id)
+    if hit is not None and now - hit[0] < _PORT_TTL:
+        return hit[1]
     meta = manager.get_app(app_id)
     if not meta.port:
         raise HTTPException(status_code=404, detail="app port not assigned yet")
-    return int(meta.port)
+    port = int(meta.port)
+    _port_cache[app_id] = (now, port)
+    return port
 
 
 @app.api_route("/apps/{app_id}/{path:path}", methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS", "HEAD"])
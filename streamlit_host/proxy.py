@@ -1,11 +1,15 @@
 from __future__ import annotations
 
 import asyncio
-from typing import Iterable
+from collections import OrderedDict
+from functools import lru_cache
+from typing import AsyncIterator, Iterable
 
 import httpx
 from fastapi import Request, WebSocket
-from starlette.responses import PlainTextResponse, Response
+from starlette.background import BackgroundTask
+from starlette.requests import ClientDisconnect
+from starlette.responses import PlainTextResponse, Response, StreamingResponse
 from starlette.websockets import WebSocketDisconnect
 import websockets
 
@@ -23,22 +27,115 @@ HOP_BY_HOP_HEADERS = {
     "host",
     "content-length",
 }
+_HOP_BY_HOP_BYTES = frozenset(h.encode("latin-1") for h in HOP_BY_HOP_HEADERS)
+# WebSocket 握手时透传给上游的请求头（ASGI header 名为小写 bytes）
+_WS_FORWARD_BYTES = frozenset((b"cookie", b"authorization"))
+# 响应头中需要去掉的：逐跳头；Content-Length 除外（流式转发的是上游原始字节，长度不变）
+_RESP_SKIP_BYTES = _HOP_BY_HOP_BYTES - {b"content-length"}
 
 
-def _filter_headers(headers: Iterable[tuple[bytes, bytes]]) -> dict[str, str]:
-    out: dict[str, str] = {}
-    for k, v in headers:
-        ks = k.decode("latin-1").lower()
-        if ks in HOP_BY_HOP_HEADERS:
-            continue
-        out[k.decode("latin-1")] = v.decode("latin-1")
-    return out
+# 全进程共用一个 AsyncClient：到各上游 streamlit 的连接保持 keep-alive 复用，不再每个请求都建连/断开
+_client: httpx.AsyncClient | None = None
+
+
+def _get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            follow_redirects=False,
+            timeout=httpx.Timeout(30.0, read=30.0),
+            # 浏览器两次交互之间常有数秒空闲，httpx 默认 5 秒的 keep-alive 过期会让连接反复重建；
+            # 上游 tornado 的空闲连接超时远大于 30 秒
+            limits=httpx.Limits(max_connections=1024, max_keepalive_connections=256, keepalive_expiry=30.0),
+        )
+    return _client
+
+
+async def aclose_client() -> None:
+    """关闭共享的 AsyncClient（应用退出时调用）。"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+# 静态资源缓存：Streamlit 前端的 JS/CSS 等位于 .../static/ 下、文件名带内容哈希，
+# 同一 URL 内容不变。缓存其 200 响应，重复访问（含 If-None-Match -> 304）不再回源
+_STATIC_CACHE_MAX_ENTRIES = 256
+_STATIC_CACHE_MAX_BYTES = 64 * 1024 * 1024
+_STATIC_CACHE_MAX_ENTRY = 8 * 1024 * 1024
+# key: (upstream, raw_path+query, accept-encoding)；value: (响应头, 响应体)
+_static_cache: OrderedDict[tuple[str, bytes, str], tuple[list[tuple[bytes, bytes]], bytes]] = OrderedDict()
+_static_cache_bytes = 0
+
+
+def _static_cache_put(key: tuple[str, bytes, str], headers: list[tuple[bytes, bytes]], body: bytes) -> None:
+    global _static_cache_bytes
+    old = _static_cache.pop(key, None)
+    if old is not None:
+        _static_cache_bytes -= len(old[1])
+    _static_cache[key] = (headers, body)
+    _static_cache_bytes += len(body)
+    # 按最久未使用淘汰，同时限制条目数与总字节数
+    while len(_static_cache) > _STATIC_CACHE_MAX_ENTRIES or _static_cache_bytes > _STATIC_CACHE_MAX_BYTES:
+        _, (_, evicted) = _static_cache.popitem(last=False)
+        _static_cache_bytes -= len(evicted)
+
+
+def _is_static_cacheable(resp: httpx.Response) -> bool:
+    if resp.status_code != 200 or "set-cookie" in resp.headers:
+        return False
+    cc = resp.headers.get("cache-control", "").lower()
+    # Streamlit 对带哈希的资源返回 "public"，对 index.html 返回 "no-cache"
+    if "no-cache" in cc or "no-store" in cc or "private" in cc:
+        return False
+    if "public" not in cc and "immutable" not in cc:
+        return False
+    cl = resp.headers.get("content-length")
+    return cl is None or int(cl) <= _STATIC_CACHE_MAX_ENTRY
+
+
+def _cached_response(request: Request, headers: list[tuple[bytes, bytes]], body: bytes) -> Response:
+    inm = request.headers.get("if-none-match")
+    if inm is not None and (b"etag", inm.encode("latin-1")) in headers:
+        resp = Response(status_code=304)
+        resp.raw_headers.extend(kv for kv in headers if kv[0] in (b"etag", b"cache-control"))
+        return resp
+    # Content-Length 由 Response 按 body 生成
+    resp = Response(body, status_code=200)
+    resp.raw_headers.extend(headers)
+    return resp
+
+
+async def _chain(head: list[bytes], rest: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    for chunk in head:
+        yield chunk
+    async for chunk in rest:
+        yield chunk
+
+
+@lru_cache(maxsize=256)
+def _base_url(upstream: str) -> httpx.URL:
+    # upstream 取值有限（admin 与各 app 的 127.0.0.1:port），解析结果可复用
+    return httpx.URL(upstream)
+
+
+def _filter_headers(headers: Iterable[tuple[bytes, bytes]]) -> list[tuple[bytes, bytes]]:
+    # ASGI 规范保证 scope 中的 header 名已是小写字节串：直接按 bytes 过滤，保持 bytes 交给 httpx，不做解码/编码往返
+    return [(k, v) for k, v in headers if k not in _HOP_BY_HOP_BYTES]
 
 
 def _rewrite_location(location: str, upstream_base: str, public_base: str) -> str:
     """
     把上游返回的绝对 Location（可能带内部端口，如 8500/85xx）重写成 public_base（通常是 8080）。
     """
+    # 相对地址（Streamlit 的跳转基本都是）无需处理；上游给出的绝对地址通常与 upstream_base 前缀一致，直接替换前缀
+    if "://" not in location:
+        return location
+    up = upstream_base.rstrip("/")
+    if location.startswith(up) and location[len(up) : len(up) + 1] in ("", "/", "?", "#"):
+        return public_base.rstrip("/") + location[len(up) :]
+    # 其余情况（如 scheme 不同、端口写法不同）再按 URL 解析比较 host/port
     try:
         up = httpx.URL(upstream_base)
         pub = httpx.URL(public_base)
@@ -51,17 +148,12 @@ def _rewrite_location(location: str, upstream_base: str, public_base: str) -> st
     return location
 
 
-def _select_ws_forward_headers(headers: dict[str, str]) -> list[tuple[str, str]]:
+def _select_ws_forward_headers(headers: Iterable[tuple[bytes, bytes]]) -> list[tuple[str, str]]:
     """
     WebSocket 反代时不要透传客户端握手头（Sec-WebSocket-* 等），否则容易导致上游握手失败。
-    通常只需要透传 cookie / authorization 等鉴权上下文。
+    通常只需要透传 cookie / authorization 等鉴权上下文。直接扫描 ASGI 原始 header，只解码命中的几项。
     """
-    out: list[tuple[str, str]] = []
-    for k, v in headers.items():
-        kl = k.lower()
-        if kl in ("cookie", "authorization"):
-            out.append((k, v))
-    return out
+    return [(k.decode("latin-1"), v.decode("latin-1")) for k, v in headers if k in _WS_FORWARD_BYTES]
 
 
 async def proxy_http(request: Request, upstream: str) -> Response:
@@ -69,55 +161,112 @@ async def proxy_http(request: Request, upstream: str) -> Response:
     反向代理 HTTP：把当前 Request 原样转发到 upstream（含 path/query），并返回响应。
     upstream 形如: http://127.0.0.1:8500
     """
-    url = httpx.URL(upstream).join(request.url.path)
-    if request.url.query:
-        url = url.copy_with(query=request.url.query.encode("utf-8"))
+    # 直接用 ASGI 原始 path/query 字节拼到缓存的上游地址上，一次 copy_with，不再每次解析 upstream 再 join
+    scope = request.scope
+    raw_path = scope.get("raw_path") or request.url.path.encode("utf-8")
+    query = scope.get("query_string")
+    if query:
+        raw_path = raw_path + b"?" + query
+    url = _base_url(upstream).copy_with(raw_path=raw_path)
+
+    cache_key = None
+    if request.method == "GET" and b"/static/" in raw_path and "range" not in request.headers:
+        # 响应体可能按 Accept-Encoding 压缩，缓存需按其区分
+        cache_key = (upstream, raw_path, request.headers.get("accept-encoding", ""))
+        hit = _static_cache.get(cache_key)
+        if hit is not None:
+            _static_cache.move_to_end(cache_key)
+            return _cached_response(request, *hit)
 
-    async with httpx.AsyncClient(follow_redirects=False, timeout=httpx.Timeout(30.0, read=30.0)) as client:
+    client = _get_client()
+    try:
+        # 原始 host 属于 HOP_BY_HOP_HEADERS，已在过滤时去掉，下面只需补上一次，不会重复
+        req_headers = _filter_headers(scope.get("headers", []))
+        # 关键：把外部 Host / X-Forwarded-* 传给上游，让 Streamlit 生成正确的资源/WS 地址
+        external_host = request.headers.get("host")
+        if external_host:
+            host_b = external_host.encode("latin-1")
+            req_headers.append((b"host", host_b))
+            req_headers.append((b"x-forwarded-host", host_b))
+            # 端口取最后一个冒号之后；冒号落在 IPv6 方括号内（如 "[::1]"）时说明没有端口
+            i = host_b.rfind(b":")
+            if i > host_b.rfind(b"]"):
+                req_headers.append((b"x-forwarded-port", host_b[i + 1 :]))
+        req_headers.append((b"x-forwarded-proto", scope["scheme"].encode("latin-1")))
+        # 客户端的 Accept-Encoding 原样透传：响应体不经解压直接转发，压缩与否由上游和浏览器协商。
+        # 客户端未声明时显式要求 identity，否则 httpx 会补上默认的 gzip/br，把压缩内容交给不支持的客户端
+        if "accept-encoding" not in request.headers:
+            req_headers.append((b"accept-encoding", b"identity"))
+
+        # 请求体边收边转发，不在内存中整体缓冲；有 Content-Length 时原样带上，避免退化为 chunked 上传
+        content = None
+        content_length = request.headers.get("content-length")
+        if content_length is not None or "transfer-encoding" in request.headers:
+            content = request.stream()
+            if content_length is not None:
+                req_headers.append((b"content-length", content_length.encode("latin-1")))
+        upstream_req = client.build_request(
+            method=request.method,
+            url=url,
+            headers=req_headers,
+            content=content,
+        )
+        upstream_resp = await client.send(upstream_req, stream=True)
+    except ClientDisconnect:
+        # 请求体流式转发途中客户端断开：已无人接收响应，不必作为服务端异常抛出
+        return Response(status_code=499)
+    except httpx.ReadError as e:
+        return PlainTextResponse(f"upstream read error: {e}", status_code=502)
+    except httpx.ConnectError as e:
+        return PlainTextResponse(f"upstream connect error: {e}", status_code=502)
+
+    # 响应体按原始字节流式转发（aiter_raw 不解压），Content-Encoding / Content-Length 与内容一致，可原样透传。
+    # 一次遍历原始 header 字节对：过滤逐跳头、就地重写 Location；保留重复的 header（如多个 Set-Cookie）
+    resp_headers: list[tuple[bytes, bytes]] = []
+    for k, v in upstream_resp.headers.raw:
+        # raw 保留上游原始大小写（tornado 返回 "Content-Type" 等），ASGI 要求小写
+        k = k.lower()
+        if k in _RESP_SKIP_BYTES:
+            continue
+        if k == b"location":
+            # 避免浏览器跟随跳转到内部端口
+            v = _rewrite_location(
+                v.decode("latin-1"),
+                upstream_base=upstream,
+                public_base=str(request.base_url).rstrip("/"),
+            ).encode("latin-1")
+        resp_headers.append((k, v))
+
+    body_iter = upstream_resp.aiter_raw()
+    if cache_key is not None and _is_static_cacheable(upstream_resp):
+        # 边读边累计；超过单条上限（gzip 分块响应可能没有 Content-Length）则放弃缓存，已读部分接上剩余继续流式转发
+        chunks: list[bytes] = []
+        size = 0
         try:
-            req_headers = _filter_headers(request.scope.get("headers", []))
-            # 关键：把外部 Host / X-Forwarded-* 传给上游，让 Streamlit 生成正确的资源/WS 地址
-            external_host = request.headers.get("host")
-            if external_host:
-                # 防御：避免意外残留 host 导致重复
-                req_headers.pop("host", None)
-                req_headers.pop("Host", None)
-                req_headers["Host"] = external_host
-                req_headers["X-Forwarded-Host"] = external_host
-                if ":" in external_host:
-                    req_headers["X-Forwarded-Port"] = external_host.split(":", 1)[1]
-            req_headers["X-Forwarded-Proto"] = request.url.scheme
-            # 避免压缩带来的 Content-Encoding/解压不一致问题
-            req_headers["Accept-Encoding"] = "identity"
-
-            body = await request.body()
-            upstream_resp = await client.request(
-                method=request.method,
-                url=url,
-                headers=req_headers,
-                content=body,
-            )
-        except httpx.ReadError as e:
+            while size <= _STATIC_CACHE_MAX_ENTRY:
+                chunk = await body_iter.__anext__()
+                chunks.append(chunk)
+                size += len(chunk)
+        except StopAsyncIteration:
+            await upstream_resp.aclose()
+            body = b"".join(chunks)
+            # Date 属于单次响应，不随缓存复用；Content-Length 在返回时按 body 重新生成
+            cached_headers = [kv for kv in resp_headers if kv[0] not in (b"date", b"content-length")]
+            _static_cache_put(cache_key, cached_headers, body)
+            return _cached_response(request, cached_headers, body)
+        except httpx.HTTPError as e:
+            await upstream_resp.aclose()
             return PlainTextResponse(f"upstream read error: {e}", status_code=502)
-        except httpx.ConnectError as e:
-            return PlainTextResponse(f"upstream connect error: {e}", status_code=502)
-
-        # httpx 会自动解压 gzip/br，但 header 可能仍带 Content-Encoding；透传会导致浏览器二次解压 → 白屏
-        resp_headers = {
-            k: v
-            for k, v in upstream_resp.headers.items()
-            if k.lower() not in HOP_BY_HOP_HEADERS and k.lower() not in ("content-encoding",)
-        }
-
-        # 避免浏览器跟随跳转到内部端口
-        for k in list(resp_headers.keys()):
-            if k.lower() == "location":
-                resp_headers[k] = _rewrite_location(
-                    resp_headers[k],
-                    upstream_base=upstream,
-                    public_base=str(request.base_url).rstrip("/"),
-                )
-        return Response(content=upstream_resp.content, status_code=upstream_resp.status_code, headers=resp_headers)
+        body_iter = _chain(chunks, body_iter)
+
+    response = StreamingResponse(
+        body_iter,
+        status_code=upstream_resp.status_code,
+        background=BackgroundTask(upstream_resp.aclose),
+    )
+    # 未传 headers/media_type 时 StreamingResponse 不生成任何 header，直接换成上游的原始 header 列表
+    response.raw_headers = resp_headers
+    return response
 
 
 async def proxy_ws(websocket: WebSocket, upstream_ws_url: str) -> None:
@@ -126,13 +275,13 @@ async def proxy_ws(websocket: WebSocket, upstream_ws_url: str) -> None:
     upstream_ws_url 形如: ws://127.0.0.1:8500/console/_stcore/stream?xxx
     """
     # 只透传必要上下文（避免把 Sec-WebSocket-* 握手头带给上游）
-    headers = _filter_headers(websocket.scope.get("headers", []))
-    extra_headers = _select_ws_forward_headers(headers)
+    raw_headers = websocket.scope.get("headers", [])
+    extra_headers = _select_ws_forward_headers(raw_headers)
 
     # 透传浏览器的 origin / subprotocol（Streamlit 前端会用 subprotocol；若代理端未 accept 该 subprotocol，浏览器会立刻断开）
-    h_lower = {k.lower(): v for k, v in headers.items()}
-    origin = h_lower.get("origin")
-    subp = h_lower.get("sec-websocket-protocol")
+    # websocket.headers 本身大小写不敏感，直接取这两项，不再整体解码、重建小写 dict
+    origin = websocket.headers.get("origin")
+    subp = websocket.headers.get("sec-websocket-protocol")
     offered_subprotocols = [s.strip() for s in subp.split(",")] if subp else []
 
     async with websockets.connect(
@@ -141,6 +290,12 @@ async def proxy_ws(websocket: WebSocket, upstream_ws_url: str) -> None:
         origin=origin,
         subprotocols=offered_subprotocols or None,
         ping_interval=None,
+        # 不限制单条消息大小（默认 1 MiB，大 dataframe 等消息会导致连接以 1009 断开），大小由上游 streamlit 自己把关；
+        # 写缓冲放大到 1 MiB，大消息转发时少等几次 drain
+        max_size=None,
+        write_limit=2**20,
+        # 上游在本机回环上，permessage-deflate 只会白白消耗压缩/解压 CPU
+        compression=None,
     ) as upstream:
         chosen = upstream.subprotocol
         # 先 accept 客户端，并返回与上游一致的 subprotocol，避免浏览器握手后秒断
@@ -153,30 +308,36 @@ async def proxy_ws(websocket: WebSocket, upstream_ws_url: str) -> None:
             try:
                 while True:
                     msg = await websocket.receive()
-                    if msg.get("type") == "websocket.disconnect":
-                        break
-                    if "text" in msg and msg["text"] is not None:
-                        await upstream.send(msg["text"])
-                    elif "bytes" in msg and msg["bytes"] is not None:
-                        await upstream.send(msg["bytes"])
+                    # Streamlit 前端发的是二进制帧（protobuf），先取 bytes；两者都没有即 websocket.disconnect
+                    data = msg.get("bytes")
+                    if data is None:
+                        data = msg.get("text")
+                        if data is None:
+                            break
+                    await upstream.send(data)
             except WebSocketDisconnect:
                 pass
             except Exception:
                 pass
+            finally:
+                # 任一方向结束即取消另一方向
+                t2.cancel()
 
         async def _upstream_to_client():
             try:
+                # websockets 收到的二进制帧已是 bytes、文本帧已是 str，原样转发，不再复制
                 async for m in upstream:
-                    if isinstance(m, (bytes, bytearray)):
-                        await websocket.send_bytes(bytes(m))
+                    if isinstance(m, str):
+                        await websocket.send_text(m)
                     else:
-                        await websocket.send_text(str(m))
+                        await websocket.send_bytes(m)
             except Exception:
                 pass
+            finally:
+                t1.cancel()
 
         t1 = asyncio.create_task(_client_to_upstream())
         t2 = asyncio.create_task(_upstream_to_client())
-        done, pending = await asyncio.wait({t1, t2}, return_when=asyncio.FIRST_COMPLETED)
-        for t in pending:
-            t.cancel()
+        # 等两个方向都真正退出后再离开 async with，避免被取消的任务在上游连接关闭后仍在运行
+        await asyncio.gather(t1, t2, return_exceptions=True)
 
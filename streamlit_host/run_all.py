@@ -1,9 +1,11 @@
 from __future__ import annotations
 
+import importlib.util
 import os
 import signal
 import subprocess
 import sys
+import threading
 import time
 from typing import Optional
 
@@ -14,7 +16,9 @@ def _env(name: str, default: str) -> str:
 
 
 def _popen(cmd: list[str]) -> subprocess.Popen:
-    return subprocess.Popen(cmd, stdout=sys.stdout, stderr=sys.stderr, text=True)
+    # 子进程直接继承本进程的 stdout/stderr 文件描述符，日志由内核直接写到目标（终端/容器日志），
+    # 不经过管道和本进程转发：既没有额外拷贝，也不会因为本进程来不及读而把子进程堵在写日志上
+    return subprocess.Popen(cmd, stdout=None, stderr=None)
 
 
 def main() -> int:
@@ -24,6 +28,8 @@ def main() -> int:
     admin_port = int(_env("STREAMLIT_HOST_ADMIN_PORT", "8500"))
 
     # 启动 API
+    # 注意保持单进程（不要加 --workers）：端口位图、后台准备队列等状态都在 AppManager 进程内，
+    # 多个 worker 各自分配端口会互相冲突，且只有启动应用的进程能回收其子进程
     api_cmd = [
         sys.executable,
         "-m",
@@ -34,6 +40,14 @@ def main() -> int:
         "--port",
         str(api_port),
     ]
+    # uvicorn[standard] 自带 uvloop / httptools：显式指定，缺失时（如 Windows 上没有 uvloop）沿用 uvicorn 默认实现
+    if importlib.util.find_spec("uvloop") is not None:
+        api_cmd += ["--loop", "uvloop"]
+    if importlib.util.find_spec("httptools") is not None:
+        api_cmd += ["--http", "httptools"]
+    # 每个反代请求（含静态资源）都会产生一行访问日志，默认关闭；需要排查时设置 STREAMLIT_HOST_API_ACCESS_LOG=1
+    if _env("STREAMLIT_HOST_API_ACCESS_LOG", "0") != "1":
+        api_cmd.append("--no-access-log")
     api_proc = _popen(api_cmd)
 
     # 启动管理台（Streamlit）
@@ -63,18 +77,23 @@ def main() -> int:
 
     procs = [api_proc, admin_proc]
 
+    terminating = threading.Event()
+
     def _terminate(sig: int, _frame: Optional[object] = None) -> None:
+        # 信号处理函数与主循环都可能调用（如连按两次 Ctrl+C），只执行一次
+        if terminating.is_set():
+            return
+        terminating.set()
         for p in procs:
             try:
                 p.terminate()
             except Exception:
                 pass
-        # 给一点时间优雅退出
-        deadline = time.time() + 5
+        # 给一点时间优雅退出（所有子进程共用 5 秒）
+        deadline = time.monotonic() + 5
         for p in procs:
             try:
-                while time.time() < deadline and p.poll() is None:
-                    time.sleep(0.1)
+                p.wait(timeout=max(0.0, deadline - time.monotonic()))
             except Exception:
                 pass
         for p in procs:
@@ -88,13 +107,31 @@ def main() -> int:
     signal.signal(signal.SIGINT, _terminate)
 
     # 任一进程退出则整体退出
+    if os.name == "nt":
+        while True:
+            for p in procs:
+                code = p.poll()
+                if code is not None:
+                    _terminate(signal.SIGTERM)
+                    return int(code)
+            time.sleep(0.5)
+
+    # POSIX：阻塞在 waitpid 上，子进程一退出立即返回，无需定时轮询
+    # （收到 SIGTERM/SIGINT 时先执行信号处理函数，waitpid 随后自动重试）
+    by_pid = {p.pid: p for p in procs}
     while True:
-        for p in procs:
-            code = p.poll()
-            if code is not None:
-                _terminate(signal.SIGTERM)
-                return int(code)
-        time.sleep(0.5)
+        try:
+            pid, status = os.waitpid(-1, 0)
+        except ChildProcessError:
+            # 子进程都已在信号处理函数 _terminate 中被回收
+            return next((int(p.returncode) for p in procs if p.returncode is not None), 0)
+        p = by_pid.get(pid)
+        if p is None:
+            continue
+        # 已被 waitpid 回收，手动记下退出码，避免 Popen 之后再去 wait
+        p.returncode = os.waitstatus_to_exitcode(status)
+        _terminate(signal.SIGTERM)
+        return int(p.returncode)
 
 
 if __name__ == "__main__":
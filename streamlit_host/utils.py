@@ -1,18 +1,36 @@
 from __future__ import annotations
 
 import hashlib
+import os
 import socket
 from pathlib import Path
+from typing import Optional
 
 
 def sha256_file(path: Path) -> str:
-    h = hashlib.sha256()
     with path.open("rb") as f:
+        # Python 3.11+：file_digest 在 C 层循环读取并释放 GIL
+        if hasattr(hashlib, "file_digest"):
+            return hashlib.file_digest(f, "sha256").hexdigest()
+        h = hashlib.sha256()
         for chunk in iter(lambda: f.read(1024 * 1024), b""):
             h.update(chunk)
     return h.hexdigest()
 
 
+def copy_file_sha256(src: Path, dst: Path) -> str:
+    """
+    复制 src 到 dst，同时计算内容的 sha256：读一遍即可，无需复制后再重新读取 dst。
+    """
+    h = hashlib.sha256()
+    buf = bytearray(1024 * 1024)
+    with memoryview(buf) as mv, src.open("rb") as fin, dst.open("wb") as fout:
+        while n := fin.readinto(buf):
+            h.update(mv[:n])
+            fout.write(mv[:n])
+    return h.hexdigest()
+
+
 def is_port_free(host: str, port: int) -> bool:
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
         s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
@@ -23,3 +41,55 @@ def is_port_free(host: str, port: int) -> bool:
     return True
 
 
+def ports_in_use() -> Optional[set[int]]:
+    """
+    从 /proc/net/tcp、/proc/net/tcp6 一次读出本机已占用的 TCP 端口（TIME_WAIT 除外：带 SO_REUSEADDR 可重新 bind）。
+    无法读取（非 Linux）时返回 None，由调用方退回逐个 bind 探测。
+    """
+    ports: set[int] = set()
+    found = False
+    for path in ("/proc/net/tcp", "/proc/net/tcp6"):
+        try:
+            with open(path, "rb") as f:
+                lines = f.read().splitlines()[1:]
+        except OSError:
+            continue
+        found = True
+        # 每行形如 "0: 0100007F:4A38 00000000:0000 0A ..."，第 2 列为 本地地址:端口(十六进制)，第 4 列为状态
+        for line in lines:
+            fields = line.split(None, 4)
+            if len(fields) > 3 and fields[3] != b"06":
+                ports.add(int(fields[1].rpartition(b":")[2], 16))
+    return ports if found else None
+
+
+def is_pid_alive(pid: int) -> bool:
+    """
+    进程是否仍在运行（僵尸进程视为已退出）。POSIX 上只需 waitpid/kill(pid, 0) 两个系统调用。
+    """
+    if os.name == "nt":
+        import psutil
+
+        return psutil.pid_exists(pid)
+    # 本进程启动的子进程退出后会变成僵尸：顺手回收，且直接得知它已退出
+    try:
+        if os.waitpid(pid, os.WNOHANG)[0] == pid:
+            return False
+    except ChildProcessError:
+        pass
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    # 非本进程的子进程（如服务重启前启动的应用）无法回收，通过 /proc 识别僵尸状态
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            stat = f.read()
+    except FileNotFoundError:
+        return False
+    except OSError:
+        return True
+    i = stat.rfind(b")")
+    return stat[i + 2 : i + 3] != b"Z"